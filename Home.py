@@ -20,3 +20,6 @@ with col2:
 with col3:
     st.page_link("pages/postOpDashboard.py", label="📊 Post-Op Dashboard", icon="📊")
     st.page_link("pages/postOpCSV.py", label="📝 Post-Op CSV Export", icon="📄")
+
+st.page_link("pages/trendsDashboard.py", label="📈 Trends Dashboard", icon="📈")
+st.page_link("pages/exportAll.py", label="📦 Export All Assessments", icon="📦")
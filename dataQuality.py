@@ -0,0 +1,187 @@
+import pandas as pd
+
+# --- CONFIG ---
+TRUE_VALUES = ["true", "yes", "y", "1", "1.0"]
+FALSE_VALUES = ["false", "no", "n", "0", "0.0"]
+
+# Free-text answers that mean nothing was found
+NO_FINDING_VALUES = FALSE_VALUES + ["", "none", "nil", "n/a", "nan"]
+
+INT = {"type": "int"}
+NUMBER = {"type": "number"}
+BOOL = {"type": "bool"}
+
+VAS = {**INT, "min": 0, "max": 10}
+SATISFACTION = {**INT, "min": 1, "max": 5}
+
+# Expected type and allowed values per exported column, per questionnaire.
+# Columns not listed here are passed through untouched.
+RULES = {
+    "preop": {
+        "age": {**INT, "min": 0, "max": 120},
+        "gender": {"type": "enum", "values": ["female", "male", "other", "unknown"]},
+        "pain_vas": VAS,
+        "extension_range": {**NUMBER, "min": -30, "max": 30},
+        "flexion_range": {**NUMBER, "min": 0, "max": 160},
+        "vte_cardiovascular_risk": BOOL,
+        "chronic_lung_disease": BOOL,
+        "diabetes_on_insulin": BOOL,
+        "patient_education_received": BOOL,
+        "caregiver_education": BOOL,
+        "qol_comleteted": BOOL,
+        "blood_thinners": BOOL,
+        "beta_blockers": BOOL,
+        "statins": BOOL,
+        "arbs": BOOL,
+        "ace_inhibitors": BOOL,
+        "diuretics": BOOL,
+    },
+    "intraop": {
+        "blood_loss": {**NUMBER, "min": 0, "max": 5000},
+        "prophylactic_antibiotics": BOOL,
+        "pain_management": BOOL,
+        "anticoagulants": BOOL,
+        "traditional_surgery": BOOL,
+        "minimally_invasive": BOOL,
+        "proper_alignment_prosthesis": BOOL,
+        "was_conversion_procedure": BOOL,
+    },
+    "postop": {
+        "pain_vas": VAS,
+        "patient_satisfaction": SATISFACTION,
+        "caregiver_satisfaction": SATISFACTION,
+        "length_of_stay": {**NUMBER, "min": 0, "max": 365},
+        "surgical_site_infection": BOOL,
+        "blood_clots": BOOL,
+        "nerve_damage": BOOL,
+        "knee_stiffness": BOOL,
+        "implant_problems": BOOL,
+        "dislocation": BOOL,
+        "reopen": BOOL,
+        "pain_management": BOOL,
+        "antibiotics": BOOL,
+        "anticoagulants": BOOL,
+        "antiemetics": BOOL,
+        "analgesics": BOOL,
+        "patient_education": BOOL,
+        "caregiver_education": BOOL,
+        "qol_completed": BOOL,
+        "qol_improved": BOOL,
+        "readmission_30_days": BOOL,
+        "early_mobilization": BOOL,
+        "death_within_30_days": BOOL,
+        "antibiotic_discontinuation": BOOL,
+    },
+}
+
+REPORT_COLUMNS = ["row", "form_id", "column", "value", "reason"]
+
+# --- CHECKS ---
+# Each check takes a raw column and its rule and returns the typed column plus
+# a same-shaped Series holding the rejection reason (or NA) for every cell.
+
+def _empty_reasons(series):
+    return pd.Series(pd.NA, index=series.index, dtype="object")
+
+
+def _check_number(series, rule):
+    values = pd.to_numeric(series, errors="coerce")
+    reasons = _empty_reasons(series)
+
+    reasons[series.notna() & values.isna()] = "not a number"
+    if rule["type"] == "int":
+        reasons[values.notna() & (values % 1 != 0)] = "not a whole number"
+    if "min" in rule:
+        reasons[values < rule["min"]] = f"below {rule['min']}"
+    if "max" in rule:
+        reasons[values > rule["max"]] = f"above {rule['max']}"
+
+    values = values.where(reasons.isna())
+    if rule["type"] == "int":
+        values = values.astype("Int64")
+    return values, reasons
+
+
+def _check_bool(series, rule):
+    text = series.astype(str).str.strip().str.lower()
+    values = pd.Series(pd.NA, index=series.index, dtype="boolean")
+    values[text.isin(TRUE_VALUES)] = True
+    values[text.isin(FALSE_VALUES)] = False
+
+    reasons = _empty_reasons(series)
+    reasons[series.notna() & values.isna()] = "not yes/no"
+    return values, reasons
+
+
+def _check_enum(series, rule):
+    text = series.astype(str).str.strip().str.lower()
+    allowed = text.isin(rule["values"])
+
+    reasons = _empty_reasons(series)
+    reasons[series.notna() & ~allowed] = "not one of " + ", ".join(rule["values"])
+    return text.where(series.notna() & allowed), reasons
+
+
+CHECKS = {
+    "int": _check_number,
+    "number": _check_number,
+    "bool": _check_bool,
+    "enum": _check_enum,
+}
+
+# --- VALIDATION ---
+
+def validate(stage, df):
+    """
+    Coerces a questionnaire export to typed columns in one pass per column.
+
+    Values that fail their column's type, range or enum rule are blanked (NA)
+    rather than dropping the whole row. Returns (typed_df, report), where the
+    report has one row per rejected value with its row, form_id and reason.
+    """
+    if stage not in RULES:
+        raise ValueError(f"Unknown stage: {stage}")
+
+    typed = df.copy()
+    rejected = []
+
+    for column, rule in RULES[stage].items():
+        if column not in df.columns:
+            continue
+        values, reasons = CHECKS[rule["type"]](df[column], rule)
+        typed[column] = values
+
+        failed = reasons.notna()
+        if failed.any():
+            rejected.append(pd.DataFrame({
+                "row": df.index[failed],
+                "form_id": df["form_id"][failed].to_numpy() if "form_id" in df.columns else pd.NA,
+                "column": column,
+                "value": df[column][failed].astype(str).to_numpy(),
+                "reason": reasons[failed].to_numpy(),
+            }))
+
+    if rejected:
+        report = pd.concat(rejected, ignore_index=True)
+    else:
+        report = pd.DataFrame(columns=REPORT_COLUMNS)
+    return typed, report
+
+
+def has_finding(typed, columns):
+    """
+    True for rows where any of the validated columns records a finding.
+
+    Boolean columns are used as typed. Free-text columns (e.g. the intra-op
+    complication descriptions) count when they hold anything other than a
+    "none"-style answer. Missing values never count.
+    """
+    flags = pd.Series(False, index=typed.index)
+    for column in columns:
+        series = typed[column]
+        if series.dtype == "boolean":
+            flags |= series.fillna(False).astype(bool)
+        else:
+            text = series.astype(str).str.strip().str.lower()
+            flags |= series.notna() & ~text.isin(NO_FINDING_VALUES)
+    return flags
@@ -0,0 +1,43 @@
+import streamlit as st
+
+# --- CONFIG ---
+# Upper bound on concurrent connections to the FHIR server for one user
+# session; export-all uses one per questionnaire.
+MAX_CONNECTIONS = 3
+
+# Only streamlit is imported at module level so pages can import this cheaply;
+# requests is loaded the first time a session is actually built.
+
+def make_session(bearer_token, max_connections=MAX_CONNECTIONS):
+    """Builds an authenticated session with a bounded, blocking connection pool."""
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    session.headers["Authorization"] = f"Bearer {bearer_token}"
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_connections, pool_block=True)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_fhir_client():
+    """
+    Returns (base_url, session) for the current user session.
+
+    Secrets are read on every call (cheap), so an edited secrets.toml, e.g. a
+    rotated bearer token, takes effect on the next rerun. The session is built
+    once per user session and reused across page switches until the secrets
+    change. Each user gets their own MAX_CONNECTIONS pool, so one user's
+    export-all never blocks another user's export.
+    """
+    base_url = st.secrets["FHIR_BASE_URL"]
+    token = st.secrets["FHIR_BEARER_TOKEN"]
+
+    client = st.session_state.get("_fhir_client")
+    if client is None or client["config"] != (base_url, token):
+        if client is not None:
+            client["session"].close()
+        client = {"config": (base_url, token), "session": make_session(token)}
+        st.session_state["_fhir_client"] = client
+    return base_url, client["session"]
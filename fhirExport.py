@@ -0,0 +1,525 @@
+import collections
+import hashlib
+import io
+import itertools
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timezone
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# --- CONFIG ---
+# Responses are requested, parsed and written this many at a time, which
+# bounds memory use regardless of the size of the export.
+CHUNK_SIZE = 500
+
+# Exports smaller than this stay in memory; larger ones spill to disk.
+SPOOL_MAX_SIZE = 16 * 1024 * 1024
+
+# Worker processes that parse chunks for the export-all page.
+PARSE_WORKERS = min(3, os.cpu_count() or 1)
+
+# --- FHIR ---
+
+def iter_questionnaire_responses(session, base_url, questionnaire, page_size=CHUNK_SIZE):
+    """Yields response entries page by page, following the Bundle's next links."""
+    url = f"{base_url}/QuestionnaireResponse"
+    params = {
+        "questionnaire": questionnaire,
+        "_count": page_size
+    }
+    while url:
+        response = session.get(url, params=params)
+        response.raise_for_status()
+        bundle = response.json()
+
+        yield from bundle.get('entry', [])
+
+        # The next link already carries the search parameters
+        url = next((link["url"] for link in bundle.get("link", []) if link.get("relation") == "next"), None)
+        params = None
+
+# --- PARSING ---
+
+def extract_joined_by_linkid(items, linkid):
+    if not isinstance(items, list):
+        return None
+
+    for item in items:
+        if item.get("linkId") == linkid and "answer" in item:
+            answers = item["answer"]
+            values = []
+
+            for answer in answers:
+                val = answer.get("value") or {}
+
+                # Handle valueCoding (multi-answer like diagnosis)
+                if isinstance(val, dict):
+                    if "Coding" in val:
+                        coding = val["Coding"]
+                        display = coding.get("display") or coding.get("code")
+                        values.append(display.strip() if display else "")
+                    else:
+                        # fallback for other types
+                        for key in ["string", "boolean", "integer", "date"]:
+                            if key in val:
+                                values.append(str(val[key]))
+                else:
+                    values.append(str(val))
+
+            return ", ".join(filter(None, values)) if values else None
+
+        # Recursively search nested items
+        if "item" in item:
+            nested = extract_joined_by_linkid(item["item"], linkid)
+            if nested is not None:
+                return nested
+
+    return None
+
+
+def extract_signature_data(items):
+    for item in items:
+        if item.get("linkId") == "Wzw_ds6Q" and "answer" in item:
+            value = item["answer"][0].get("value", {})
+            attachment = value.get("Attachment")
+            if attachment and "data" in attachment:
+                return "data:image/png;base64," + attachment["data"]
+
+        # Recursively check nested items
+        if "item" in item:
+            nested = extract_signature_data(item["item"])
+            if nested:
+                return nested
+    return None
+
+
+def extract_value_from_answer(answer):
+    """Extracts raw value from the answer dict."""
+    if "value" in answer:
+        value = answer["value"]
+        if isinstance(value, dict):
+            # Check for types inside `value`
+            if "boolean" in value:
+                return value["boolean"]
+            elif "integer" in value:
+                return value["integer"]
+            elif "string" in value:
+                return value["string"]
+            elif "date" in value:
+                return value["date"]
+            elif "Coding" in value:
+                return value["Coding"].get("display") or value["Coding"].get("code")
+            elif "Reference" in value:
+                return value["Reference"].get("id") or value["Reference"].get("reference")
+        else:
+            return value
+    return None
+
+
+def extract_by_linkid(items, target_linkid):
+    if not isinstance(items, list):
+        return None
+
+    for item in items:
+        if item.get("linkId") == target_linkid and "answer" in item:
+            return extract_value_from_answer(item["answer"][0])
+
+        # Recurse into nested groups
+        if "item" in item:
+            nested = extract_by_linkid(item["item"], target_linkid)
+            if nested is not None:
+                return nested
+
+    return None
+
+
+def parse_preop_response(response):
+    item = response["resource"]["item"]
+    patient_id = response["resource"]["subject"]["id"]
+    form_id = response["resource"]["id"]
+
+    return {
+        "form_id": form_id,
+        "patient_id": patient_id,
+        "authored": response["resource"].get("authored"),
+        "mrn": extract_joined_by_linkid(item, "patient-info-mrn"),
+        "age": extract_joined_by_linkid(item, "patient-info-age"),
+        "gender": extract_joined_by_linkid(item, "patient-info-gender"),
+        "race": extract_joined_by_linkid(item, "patient-info-race"),
+        "nationality": extract_joined_by_linkid(item, "patient-info-nationality"),
+        "caregiver_present": extract_joined_by_linkid(item, "patient-info-caregiver"),
+        "hospital": extract_joined_by_linkid(item, "hospital-info-hospital"),
+        "consultant": extract_joined_by_linkid(item, "hospital-info-consultant"),
+        "surgeon": extract_joined_by_linkid(item, "hospital-info-surgeon"),
+        "assistant_present": extract_joined_by_linkid(item, "hospital-info-assistant"),
+        "diagnosis": extract_joined_by_linkid(item, "diagnosis-info-diagnosis"),
+        "urgency": extract_joined_by_linkid(item, "urgency-and-medical-history-urgency"),
+        "previous_knee_surgery": extract_joined_by_linkid(item, "medical-history-previous-knee-surgery"),
+        "vte_cardiovascular_risk": extract_joined_by_linkid(item, "medical-history-vte-risk"),
+        "chronic_lung_disease": extract_joined_by_linkid(item, "medical-history-chronic-lung-disease"),
+        "diabetes_on_insulin": extract_joined_by_linkid(item, "medical-history-diabetes-insulin"),
+        "admission_date": extract_joined_by_linkid(item, "admission-date"),
+        "surgery_date": extract_joined_by_linkid(item, "surgery-date"),
+        "surgery_access": extract_joined_by_linkid(item, "surgical-access"),
+        "surgery_type": extract_joined_by_linkid(item, "surgery-operation-type"),
+        "patient_education_received": extract_joined_by_linkid(item, "patient-education"),
+        "caregiver_education": extract_joined_by_linkid(item, "caregiver-education"),
+        "qol_comleteted": extract_joined_by_linkid(item, "patient-education-health-status-qol-completed"),
+        "pain_vas": extract_joined_by_linkid(item, "patient-education-health-status-pain-vas"),
+        "current_infection": extract_joined_by_linkid(item, "patient-education-health-status-current-infections"),
+        "recent_infection": extract_joined_by_linkid(item, "patient-education-health-status-recent-infections"),
+        "smoke": extract_joined_by_linkid(item, "risk-lifestyle-smoking"),
+        "alcohol": extract_joined_by_linkid(item, "risk-lifestyle-alcohol"),
+        "comorbidities": extract_joined_by_linkid(item, "risk-lifestyle-comorbidities"),
+        "blood_thinners": extract_joined_by_linkid(item, "medications-blood-thinners"),
+        "beta_blockers": extract_joined_by_linkid(item, "medications-beta-blockers"),
+        "statins": extract_joined_by_linkid(item, "medications-statins"),
+        "arbs": extract_joined_by_linkid(item, "medications-arbs"),
+        "ace_inhibitors": extract_joined_by_linkid(item, "medications-ace-inhibitors"),
+        "diuretics": extract_joined_by_linkid(item, "medications-diuretics"),
+        "charnley": extract_joined_by_linkid(item, "functional-clinical-assessment-charnley"),
+        "anatomic_alignment": extract_joined_by_linkid(item, "functional-clinical-assessment-alignment"),
+        "ml_extension_rating": extract_joined_by_linkid(item, "ml-instability-extension-rating"),
+        "ml_flexion_rating": extract_joined_by_linkid(item, "ml-instability-flexion-rating"),
+        "ap_extension_rating": extract_joined_by_linkid(item, "ap-instability-extension-rating"),
+        "ap_flexion_rating": extract_joined_by_linkid(item, "ap-instability-flexion-rating"),
+        "extension_range": extract_joined_by_linkid(item, "rom-extension-range"),
+        "flexion_range": extract_joined_by_linkid(item, "rom-flexion-range"),
+        "flexion_contracture_deductions": extract_joined_by_linkid(item, "functional-clinical-assessment-flexion-deduction"),
+        "extensor_lag_deductions": extract_joined_by_linkid(item, "functional-clinical-assessment-extensor-deduction"),
+        "morse_fall_risk_scale": extract_joined_by_linkid(item, "functional-clinical-assessment-morse-fall"),
+        "signature_base64": extract_signature_data(item)
+    }
+
+
+def parse_intraop_response(response):
+    r = response["resource"]
+    items = r.get("item", [])
+
+    return {
+        "form_id": r.get("id"),
+        "patient_id": r.get("subject", {}).get("id"),
+        "authored": r.get("authored"),
+        "blood_loss": extract_by_linkid(items, "blood-loss"),
+        "surgical_complications": extract_by_linkid(items, "surgical-complications"),
+        "anaesthetic_complications": extract_by_linkid(items, "anaesthetic-complications"),
+        "prophylactic_antibiotics": extract_by_linkid(items, "prophylactic-antibiotics"),
+        "pain_management": extract_by_linkid(items, "pain-management"),
+        "anticoagulants": extract_by_linkid(items, "anticoagulants"),
+        "traditional_surgery": extract_by_linkid(items, "traditional-open-surgery"),
+        "minimally_invasive": extract_by_linkid(items, "minimally-invasive"),
+        "proper_alignment_prosthesis": extract_by_linkid(items, "alignment"),
+        "navigation_system": extract_by_linkid(items, "navigation-system"),
+        "implants": extract_by_linkid(items, "implants"),
+        "was_conversion_procedure": extract_by_linkid(items, "conversion"),
+    }
+
+
+def parse_postop_response(response):
+    r = response["resource"]
+    items = r.get("item", [])
+
+    return {
+        "form_id": r.get("id"),
+        "patient_id": r.get("subject", {}).get("id"),
+        "authored": r.get("authored"),
+        "surgical_site_infection": extract_by_linkid(items, "surgical-site-infection"),
+        "blood_clots": extract_by_linkid(items, "blood-clots"),
+        "nerve_damage": extract_by_linkid(items, "nerve-damage"),
+        "knee_stiffness": extract_by_linkid(items, "knee-stiffness"),
+        "implant_problems": extract_by_linkid(items, "implant-problems"),
+        "dislocation": extract_by_linkid(items, "dislocation"),
+        "reopen": extract_by_linkid(items, "reoperation"),
+        "pain_management": extract_by_linkid(items, "pain-management"),
+        "antibiotics": extract_by_linkid(items, "antibiotics"),
+        "anticoagulants": extract_by_linkid(items, "anticoagulants"),
+        "antiemetics": extract_by_linkid(items, "antiemetics"),
+        "analgesics": extract_by_linkid(items, "analgesics"),
+        "patient_education": extract_by_linkid(items, "patient-education"),
+        "caregiver_education": extract_by_linkid(items, "caregiver-education"),
+        "qol_completed": extract_by_linkid(items, "qol-questionnaire-completed"),
+        "qol_improved": extract_by_linkid(items, "qol-questionnaire-improved"),
+        "pain_vas": extract_by_linkid(items, "pain-vas"),
+        "wound_healing": extract_by_linkid(items, "wound-healing"),
+        "support_measure": extract_by_linkid(items, "support-measure"),
+        "patient_satisfaction": extract_by_linkid(items, "patient-satisfaction"),
+        "caregiver_satisfaction": extract_by_linkid(items, "caregiver-satisfaction"),
+        "length_of_stay": extract_by_linkid(items, "length-of-stay"),
+        "day_stepdown_cicu": extract_by_linkid(items, "day-stepdown-cicu"),
+        "readmission_30_days": extract_by_linkid(items, "readmission-30-days"),
+        "rehabilitation": extract_by_linkid(items, "rehab-progress"),
+        "early_mobilization": extract_by_linkid(items, "early-mobilization"),
+        "death_within_30_days": extract_by_linkid(items, "death-within-30-days"),
+        "antibiotic_discontinuation": extract_by_linkid(items, "antibiotic-discontinuation"),
+    }
+
+
+def clean_dashes(df):
+    """Replaces en/em dashes that break some spreadsheet imports."""
+    return df.map(lambda x: x.replace("–", "-").replace("—", "-") if isinstance(x, str) else x)
+
+
+QUESTIONNAIRES = {
+    "preop": {
+        "url": "https://novoheal.com/TKR_PreOp_Assessment",
+        "parse": parse_preop_response,
+        "file_name": "TKR_PreOp_Assessments",
+    },
+    "intraop": {
+        "url": "https://novoheal.com/TKR_IntraOp_Assessment",
+        "parse": parse_intraop_response,
+        "file_name": "TKR_IntraOp_Assessments",
+    },
+    "postop": {
+        "url": "https://novoheal.com/TKR_PostOp_Assessment",
+        "parse": parse_postop_response,
+        "file_name": "TKR_PostOp_Assessments",
+    },
+}
+
+
+def _iter_entry_chunks(session, base_url, stage, chunk_size):
+    entries = iter_questionnaire_responses(session, base_url, QUESTIONNAIRES[stage]["url"], page_size=chunk_size)
+    while True:
+        chunk = list(itertools.islice(entries, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def parse_chunk(stage, entries):
+    """Parses a list of response entries into one cleaned DataFrame."""
+    parse = QUESTIONNAIRES[stage]["parse"]
+    return clean_dashes(pd.DataFrame([parse(entry) for entry in entries]))
+
+
+def iter_questionnaire_frames(session, base_url, stage, chunk_size=CHUNK_SIZE):
+    """Fetches and parses one questionnaire as cleaned DataFrames of chunk_size rows."""
+    for entries in _iter_entry_chunks(session, base_url, stage, chunk_size):
+        yield parse_chunk(stage, entries)
+
+
+_parse_pool = None
+_parse_pool_lock = threading.Lock()
+
+
+def get_parse_pool():
+    """
+    Process pool for parsing, started on first use and kept for later exports.
+
+    Parsing is pure-Python dict walking, so threads would serialize on the GIL.
+    Workers are spawned rather than forked because the Streamlit server is
+    multi-threaded. Returns None on a single core, where a one-worker pool only
+    adds pickling overhead.
+    """
+    global _parse_pool
+    if PARSE_WORKERS < 2:
+        return None
+    with _parse_pool_lock:
+        if _parse_pool is None:
+            _parse_pool = ProcessPoolExecutor(
+                max_workers=PARSE_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _parse_pool
+
+
+def _iter_parsed_chunks(session, base_url, stage, parse_pool):
+    """
+    Yields one questionnaire's parsed chunks in order, parsing in the pool.
+
+    Each fetched chunk is submitted straight away so parsing overlaps with
+    downloading the next one. At most PARSE_WORKERS chunks wait in flight, which
+    keeps memory bounded by the chunk size. Without a pool, chunks are parsed
+    in the calling thread.
+    """
+    if parse_pool is None:
+        yield from iter_questionnaire_frames(session, base_url, stage)
+        return
+
+    pending = collections.deque()
+    for entries in _iter_entry_chunks(session, base_url, stage, CHUNK_SIZE):
+        pending.append(parse_pool.submit(parse_chunk, stage, entries))
+        if len(pending) > PARSE_WORKERS:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+# --- DOWNLOADS ---
+
+def write_csv_chunks(chunks, fileobj):
+    """Writes DataFrame chunks to a binary file as one UTF-8 (BOM) CSV; returns the row count."""
+    text = io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline="", write_through=True)
+    rows = 0
+    try:
+        for i, chunk in enumerate(chunks):
+            chunk.to_csv(text, index=False, header=i == 0)
+            rows += len(chunk)
+        text.flush()
+    finally:
+        # Leave fileobj open for the caller
+        text.detach()
+    return rows
+
+
+def spool_csv(chunks):
+    """Streams DataFrame chunks into a spooled temp file; returns (file, row count)."""
+    csv_file = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    rows = write_csv_chunks(chunks, csv_file)
+    csv_file.seek(0)
+    return csv_file, rows
+
+
+def as_download(fileobj):
+    """
+    Reads a spooled export into bytes for st.download_button and closes it.
+
+    Streamlit keeps one full in-memory copy of every download it serves, so
+    these bytes are that copy. Reading the spool directly avoids forcing a
+    small in-memory spool to disk just to hand it over.
+    """
+    with fileobj:
+        fileobj.seek(0)
+        return fileobj.read()
+
+# --- ARCHIVE ---
+
+class _HashingWriter(io.RawIOBase):
+    """Write-through wrapper that tracks size and SHA-256 of what passes."""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.sha256.update(b)
+        self.size += len(b)
+        return self.raw.write(b)
+
+    def tell(self):
+        return self.size
+
+
+def _parquet_safe(chunk):
+    # Answers mix booleans, numbers and strings, and a column's inferred dtype
+    # can change from chunk to chunk (e.g. all-empty in one, numeric in the
+    # next). Nullable text keeps one schema for every row group in the file.
+    return chunk.astype("string")
+
+
+def _spool_questionnaire(stage, chunks):
+    """
+    Streams one questionnaire's chunks into spooled CSV and Parquet files.
+
+    The CSV is written chunk by chunk with a single header and the Parquet
+    file gets one row group per chunk, so no full DataFrame is ever built.
+    Returns (row count, {file name: rewound spool}).
+    """
+    base_name = QUESTIONNAIRES[stage]["file_name"]
+    csv_file = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    parquet_file = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    parquet_writer = None
+
+    def write_parquet(chunks):
+        nonlocal parquet_writer
+        for chunk in chunks:
+            table = pa.Table.from_pandas(_parquet_safe(chunk), preserve_index=False)
+            if parquet_writer is None:
+                parquet_writer = pq.ParquetWriter(parquet_file, table.schema)
+            parquet_writer.write_table(table, row_group_size=len(chunk))
+            yield chunk
+
+    try:
+        rows = write_csv_chunks(write_parquet(chunks), csv_file)
+    finally:
+        if parquet_writer is not None:
+            parquet_writer.close()
+    if parquet_writer is None:
+        pq.write_table(pa.table({}), parquet_file)
+
+    csv_file.seek(0)
+    parquet_file.seek(0)
+    return rows, {f"{base_name}.csv": csv_file, f"{base_name}.parquet": parquet_file}
+
+
+def write_export_archive(spooled, fileobj):
+    """
+    Copies spooled questionnaire files into a ZIP and adds a manifest.
+
+    Files are streamed into their ZIP entries while their SHA-256 checksums
+    are computed. The manifest records row counts, sizes and checksums.
+    """
+    manifest = {
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "questionnaires": {},
+    }
+
+    with zipfile.ZipFile(fileobj, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for stage, (rows, spools) in spooled.items():
+            files = {}
+            for name, spool in spools.items():
+                with spool, zf.open(name, "w", force_zip64=True) as entry:
+                    writer = _HashingWriter(entry)
+                    shutil.copyfileobj(spool, writer)
+                files[name] = {"bytes": writer.size, "sha256": writer.sha256.hexdigest()}
+
+            manifest["questionnaires"][stage] = {
+                "questionnaire": QUESTIONNAIRES[stage]["url"],
+                "rows": rows,
+                "files": files,
+            }
+
+        zf.writestr("manifest.json", json.dumps(manifest, indent=2))
+
+    return manifest
+
+
+def build_export_archive(session, base_url, stages=None, wrap_chunks=None):
+    """
+    Exports several questionnaires concurrently into one ZIP.
+
+    One thread per questionnaire fetches pages over the shared session, has
+    them parsed in the process pool and streams the parsed chunks into its own
+    spooled CSV and Parquet files. wrap_chunks(stage, chunks), if given, can
+    observe or transform each stream on the way (e.g. trendIndex.index_chunks).
+    Returns the rewound archive and its manifest.
+    """
+    global _parse_pool
+    stages = list(stages or QUESTIONNAIRES)
+    parse_pool = get_parse_pool()
+
+    def export_stage(stage):
+        chunks = _iter_parsed_chunks(session, base_url, stage, parse_pool)
+        if wrap_chunks is not None:
+            chunks = wrap_chunks(stage, chunks)
+        return _spool_questionnaire(stage, chunks)
+
+    try:
+        with ThreadPoolExecutor(max_workers=len(stages)) as pool:
+            futures = {stage: pool.submit(export_stage, stage) for stage in stages}
+            spooled = {stage: future.result() for stage, future in futures.items()}
+    except BrokenProcessPool:
+        # A dead worker breaks the pool for good; start a fresh one next time
+        with _parse_pool_lock:
+            if _parse_pool is parse_pool:
+                _parse_pool = None
+        raise
+
+    archive = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    manifest = write_export_archive(spooled, archive)
+    archive.seek(0)
+    return archive, manifest
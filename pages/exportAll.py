@@ -0,0 +1,43 @@
+import streamlit as st
+
+from fhirClient import get_fhir_client
+
+# --- STREAMLIT APP ---
+
+st.title("Export All TKR Assessments")
+
+st.markdown(
+    "Fetches the Pre-Op, Intra-Op and Post-Op questionnaires together and bundles them "
+    "into one ZIP with CSV and Parquet files plus a manifest of row counts and checksums."
+)
+
+if st.button("Load all data"):
+    with st.spinner("Fetching all questionnaires..."):
+        try:
+            # Deferred so the page renders without loading pandas
+            from fhirExport import QUESTIONNAIRES, as_download, build_export_archive
+            from trendIndex import index_chunks
+
+            fhir_base_url, session = get_fhir_client()
+            # Parsed chunks are indexed and streamed into the ZIP as they arrive
+            archive, manifest = build_export_archive(session, fhir_base_url, wrap_chunks=index_chunks)
+
+            st.success("✅ Data loaded successfully!")
+
+            st.download_button(
+                label="📦 Download TKR Export (ZIP)",
+                data=as_download(archive),
+                file_name="TKR_Assessments.zip",
+                mime="application/zip"
+            )
+
+            st.dataframe(
+                {
+                    "Questionnaire": [QUESTIONNAIRES[stage]["file_name"] for stage in manifest["questionnaires"]],
+                    "Rows": [info["rows"] for info in manifest["questionnaires"].values()],
+                },
+                hide_index=True
+            )
+
+        except Exception as e:
+            st.error(f"❌ Error: {e}")
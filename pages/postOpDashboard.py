@@ -1,20 +1,34 @@
+import io
+
 import streamlit as st
-import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
 
 st.set_page_config(page_title="TKR Post-Op Dashboard", layout="wide")
 
 st.title("🦿 TKR Post-Op Assessment Dashboard")
 
+# --- Validation ---
+@st.cache_data
+def load_data(file_bytes):
+    """Reads and validates an export once per file; reruns reuse the typed result."""
+    import pandas as pd
+    from dataQuality import validate
+
+    df = pd.read_csv(io.BytesIO(file_bytes), encoding="utf-8-sig")
+    return validate("postop", df)
+
+
 # Upload CSV
 uploaded_file = st.file_uploader("Upload Post-Op CSV", type=["csv"])
 
 if uploaded_file:
-    df = pd.read_csv(uploaded_file)
+    # Heavy libraries are only loaded once there is data to chart
+    import plotly.express as px
+
+    df, report = load_data(uploaded_file.getvalue())
 
-    # Convert all TRUE/FALSE to boolean
-    df.replace({"TRUE": True, "FALSE": False, "": None}, inplace=True)
+    if not report.empty:
+        with st.expander(f"⚠️ {len(report)} value(s) failed validation and were left blank"):
+            st.dataframe(report, hide_index=True)
 
     # -----------------------
     st.header("📊 Score Distributions")
@@ -24,8 +38,8 @@ if uploaded_file:
 
     with col1:
         st.markdown("**🩺 Pain VAS (0–10)**")
-        vas_counts = df['pain_vas'].dropna().astype(int).value_counts().sort_index()
-        vas_range = list(range(0, 10))
+        vas_counts = df['pain_vas'].value_counts().sort_index()
+        vas_range = list(range(0, 11))
         vas_counts = vas_counts.reindex(vas_range, fill_value=0)
         fig_vas = px.bar(
             x=vas_counts.values,
@@ -38,7 +52,7 @@ if uploaded_file:
 
     with col2:
         st.markdown("**😊 Patient Satisfaction (1–5)**")
-        psat_counts = df['patient_satisfaction'].dropna().astype(int).value_counts().sort_index()
+        psat_counts = df['patient_satisfaction'].value_counts().sort_index()
         psat_range = list(range(1, 6))  # Should go up to 5
         psat_counts = psat_counts.reindex(psat_range, fill_value=0)
         fig_psat = px.bar(
@@ -52,7 +66,7 @@ if uploaded_file:
 
     with col3:
         st.markdown("**🧑‍⚕️ Caregiver Satisfaction (1–5)**")
-        csat_counts = df['caregiver_satisfaction'].dropna().astype(int).value_counts().sort_index()
+        csat_counts = df['caregiver_satisfaction'].value_counts().sort_index()
         csat_range = list(range(1, 6))  # Should go up to 5
         csat_counts = csat_counts.reindex(csat_range, fill_value=0)
         fig_csat = px.bar(
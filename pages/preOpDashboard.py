@@ -1,18 +1,35 @@
-import streamlit as st
-import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
+import io
 
+import streamlit as st
 
 st.set_page_config(page_title="TKR Pre-Op Dashboard", layout="wide")
 
 st.title("🦵 TKR Pre-Op Assessment Dashboard")
 
+# --- Validation ---
+@st.cache_data
+def load_data(file_bytes):
+    """Reads and validates an export once per file; reruns reuse the typed result."""
+    import pandas as pd
+    from dataQuality import validate
+
+    df = pd.read_csv(io.BytesIO(file_bytes), encoding="utf-8-sig")
+    return validate("preop", df)
+
+
 # --- Load Data ---
 uploaded_file = st.file_uploader("Upload exported CSV", type=["csv"])
 
 if uploaded_file:
-    df = pd.read_csv(uploaded_file, encoding="utf-8-sig")
+    # Heavy libraries are only loaded once there is data to chart
+    import pandas as pd
+    import plotly.express as px
+
+    df, report = load_data(uploaded_file.getvalue())
+
+    if not report.empty:
+        with st.expander(f"⚠️ {len(report)} value(s) failed validation and were left blank"):
+            st.dataframe(report, hide_index=True)
 
     # --- Sidebar Filters ---
     st.sidebar.header("Filters")
@@ -0,0 +1,87 @@
+import streamlit as st
+import pandas as pd
+import plotly.express as px
+
+from trendIndex import STAGES, query_trend, update_index
+
+st.set_page_config(page_title="TKR Trends Dashboard", layout="wide")
+
+st.title("📈 TKR Trends Dashboard")
+
+STAGE_LABELS = {
+    "preop": "Pre-Op",
+    "intraop": "Intra-Op",
+    "postop": "Post-Op",
+}
+
+# --- Sidebar ---
+st.sidebar.header("Trend Settings")
+granularity = st.sidebar.radio("Granularity", ["Monthly", "Weekly"])
+freq = "W" if granularity == "Weekly" else "M"
+
+st.sidebar.header("Add Export to Index")
+ingest_stage = st.sidebar.selectbox("Questionnaire", list(STAGES), format_func=STAGE_LABELS.get)
+ingest_file = st.sidebar.file_uploader("Upload exported CSV", type=["csv"])
+if ingest_file and st.sidebar.button("Index export"):
+    try:
+        added = update_index(ingest_stage, pd.read_csv(ingest_file, encoding="utf-8-sig"))
+        st.sidebar.success(f"✅ Indexed {added} new form(s).")
+    except Exception as e:
+        st.sidebar.error(f"❌ Error: {e}")
+
+# --- Load Trends ---
+trends = {stage: query_trend(stage, freq=freq) for stage in STAGES}
+
+if all(trend.empty for trend in trends.values()):
+    st.info("The trend index is empty. Load data on a CSV export page or upload an export in the sidebar.")
+    st.stop()
+
+
+def combine(metric, stages):
+    frames = []
+    for stage in stages:
+        trend = trends[stage][[metric]].dropna()
+        if trend.empty:
+            continue
+        frames.append(trend.reset_index().assign(stage=STAGE_LABELS[stage]))
+    if not frames:
+        return None
+    return pd.concat(frames, ignore_index=True)
+
+
+def trend_chart(metric, stages, title, y_label):
+    data = combine(metric, stages)
+    if data is None:
+        st.caption(f"No data for {title.lower()} yet.")
+        return
+    fig = px.line(
+        data,
+        x="period",
+        y=metric,
+        color="stage",
+        markers=True,
+        title=title,
+        labels={"period": granularity.replace("ly", ""), metric: y_label, "stage": "Questionnaire"}
+    )
+    st.plotly_chart(fig, use_container_width=True)
+
+
+# --- Volumes ---
+st.subheader("🏥 Volumes")
+trend_chart("volume", ["preop", "intraop", "postop"], "Forms per Period", "Forms")
+
+# --- Complications ---
+st.subheader("⚠️ Complication Rates")
+trend_chart("complication_rate", ["intraop", "postop"], "Complication Rate", "Share of Forms")
+
+col1, col2 = st.columns(2)
+
+# --- Length of Stay ---
+with col1:
+    st.subheader("🛏️ Length of Stay")
+    trend_chart("avg_los", ["postop"], "Average Length of Stay", "Days")
+
+# --- Pain VAS ---
+with col2:
+    st.subheader("🩺 Pain VAS")
+    trend_chart("avg_vas", ["preop", "postop"], "Average Pain VAS", "VAS (0–10)")
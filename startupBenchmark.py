@@ -0,0 +1,72 @@
+"""
+Startup benchmark for the multipage app.
+
+Every page is run in a fresh interpreter, so "cold" includes all imports the
+page triggers, as on the first visit after the server starts. "warm" is the
+fastest of a few reruns in that same process, which is what switching back to
+an already visited page costs.
+
+    python startupBenchmark.py
+"""
+import json
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent
+PAGES = ["Home.py"] + sorted(str(p.relative_to(ROOT)) for p in (ROOT / "pages").glob("*.py"))
+RERUNS = 5
+
+# Dummy values so pages that read st.secrets can run without a FHIR server
+SECRETS = {
+    "FHIR_BASE_URL": "http://localhost",
+    "FHIR_BEARER_TOKEN": "benchmark",
+}
+
+
+def measure_page(page):
+    """Runs one page cold and warm in the current process; returns timings in ms."""
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(str(ROOT / page), default_timeout=60)
+    for key, value in SECRETS.items():
+        app.secrets[key] = value
+
+    start = time.perf_counter()
+    app.run()
+    cold = time.perf_counter() - start
+
+    warm = []
+    for _ in range(RERUNS):
+        start = time.perf_counter()
+        app.run()
+        warm.append(time.perf_counter() - start)
+
+    return {
+        "page": page,
+        "cold_ms": round(cold * 1000, 1),
+        "warm_ms": round(min(warm) * 1000, 1),
+        "errors": [e.value for e in app.exception],
+    }
+
+
+def main():
+    if len(sys.argv) == 3 and sys.argv[1] == "--page":
+        print(json.dumps(measure_page(sys.argv[2])))
+        return
+
+    print(f"{'page':<32}{'cold (ms)':>12}{'warm (ms)':>12}")
+    for page in PAGES:
+        result = subprocess.run(
+            [sys.executable, __file__, "--page", page],
+            cwd=ROOT, capture_output=True, text=True, check=True
+        )
+        timings = json.loads(result.stdout.strip().splitlines()[-1])
+        print(f"{timings['page']:<32}{timings['cold_ms']:>12}{timings['warm_ms']:>12}")
+        for error in timings["errors"]:
+            print(f"    ! {error}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+import json
+import os
+import tempfile
+import threading
+from pathlib import Path
+
+import pandas as pd
+
+from dataQuality import has_finding, validate
+
+# --- CONFIG ---
+TREND_INDEX_DIR = Path(".trend_index")
+
+# Which columns date a row (first non-empty wins) and which columns count as
+# a complication, per questionnaire.
+STAGES = {
+    "preop": {
+        "date_cols": ["surgery_date", "admission_date", "authored"],
+        "complication_cols": [],
+    },
+    "intraop": {
+        "date_cols": ["authored"],
+        "complication_cols": ["surgical_complications", "anaesthetic_complications"],
+    },
+    "postop": {
+        "date_cols": ["authored"],
+        "complication_cols": [
+            "surgical_site_infection", "blood_clots", "nerve_damage", "knee_stiffness",
+            "implant_problems", "dislocation", "reopen"
+        ],
+    },
+}
+
+BUCKET_FIELDS = ["volume", "complications", "los_sum", "los_n", "vas_sum", "vas_n"]
+
+# Streamlit runs every session's script in its own thread, so concurrent
+# exports must not interleave a stage's read-modify-write of the index.
+_STAGE_LOCKS = {stage: threading.Lock() for stage in STAGES}
+
+# --- HELPERS ---
+
+def _partition_path(root, stage, month):
+    return Path(root) / stage / f"{month}.json"
+
+
+def _registry_path(root, stage):
+    # Kept beside, not inside, the stage directory so queries never read it
+    return Path(root) / f"{stage}.forms.json"
+
+
+def _load_json(path, default):
+    if not path.exists():
+        return default
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _save_json(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Unique temp name so a writer never renames another writer's file
+    with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=path.parent, suffix=".tmp", delete=False) as f:
+        json.dump(data, f)
+    os.replace(f.name, path)
+
+
+def _load_partition(path):
+    return _load_json(path, {"days": {}})
+
+
+def _apply(partition, contribution, sign):
+    """Adds (sign=1) or removes (sign=-1) one form's contribution to its day bucket."""
+    days = partition["days"]
+    bucket = days.setdefault(contribution["day"], dict.fromkeys(BUCKET_FIELDS, 0))
+    for field in BUCKET_FIELDS:
+        bucket[field] += sign * contribution[field]
+    if bucket["volume"] <= 0:
+        del days[contribution["day"]]
+
+
+def _event_dates(df, date_cols):
+    """First parseable date among date_cols, normalized to midnight."""
+    dates = pd.Series(pd.NaT, index=df.index, dtype="datetime64[ns]")
+    for col in date_cols:
+        if col not in df.columns:
+            continue
+        # FHIR dates/dateTimes all start with YYYY-MM-DD; ignore time and zone
+        parsed = pd.to_datetime(df[col].astype(str).str[:10], format="%Y-%m-%d", errors="coerce")
+        dates = dates.fillna(parsed)
+    return dates
+
+
+def _daily_buckets(df, stage):
+    """
+    Aggregates rows of one export into per-day sums and counts.
+
+    The export goes through dataQuality.validate first, so out-of-range or
+    malformed values are already blank and never reach the averages.
+    """
+    config = STAGES[stage]
+    typed, _ = validate(stage, df)
+
+    buckets = pd.DataFrame(index=typed.index)
+    buckets["day"] = _event_dates(typed, config["date_cols"]).dt.strftime("%Y-%m-%d")
+    buckets["volume"] = 1
+
+    complication_cols = [c for c in config["complication_cols"] if c in typed.columns]
+    buckets["complications"] = has_finding(typed, complication_cols).astype(int)
+
+    for prefix, col in [("los", "length_of_stay"), ("vas", "pain_vas")]:
+        if col in typed.columns:
+            values = typed[col].astype("Float64")
+        else:
+            values = pd.Series(pd.NA, index=typed.index, dtype="Float64")
+        buckets[f"{prefix}_sum"] = values.fillna(0).astype(float)
+        buckets[f"{prefix}_n"] = values.notna().astype(int)
+
+    return buckets.dropna(subset=["day"])
+
+
+def _form_records(stage, df):
+    """One bucket contribution per form (last row wins) for an export chunk."""
+    if df.empty:
+        return pd.DataFrame(columns=["form_id", "day"] + BUCKET_FIELDS)
+    if "form_id" not in df.columns:
+        raise ValueError("Export has no form_id column")
+
+    buckets = _daily_buckets(df, stage)
+    buckets["form_id"] = df.loc[buckets.index, "form_id"].astype(str)
+    buckets = buckets.drop_duplicates(subset="form_id", keep="last")
+    return buckets[["form_id", "day"] + BUCKET_FIELDS]
+
+
+def _fold_records(stage, records, root):
+    """Applies form contributions to the stored index in one locked read-modify-write."""
+    records = records.drop_duplicates(subset="form_id", keep="last")
+    if records.empty:
+        return 0
+
+    with _STAGE_LOCKS[stage]:
+        registry_path = _registry_path(root, stage)
+        registry = _load_json(registry_path, {})
+        partitions = {}
+
+        def partition_for(day):
+            month = day[:7]
+            if month not in partitions:
+                partitions[month] = _load_partition(_partition_path(root, stage, month))
+            return partitions[month]
+
+        changed = 0
+        for record in records.to_dict("records"):
+            form_id = record.pop("form_id")
+            old = registry.get(form_id)
+            if old == record:
+                continue
+            if old is not None:
+                _apply(partition_for(old["day"]), old, -1)
+            _apply(partition_for(record["day"]), record, 1)
+            registry[form_id] = record
+            changed += 1
+
+        if changed:
+            for month, partition in partitions.items():
+                _save_json(_partition_path(root, stage, month), partition)
+            _save_json(registry_path, registry)
+    return changed
+
+
+def update_index(stage, df, root=TREND_INDEX_DIR):
+    """
+    Folds a freshly exported DataFrame into the date-partitioned index.
+
+    Rows are bucketed by day into one file per month. A registry keyed by
+    form_id remembers what each form last contributed, so re-ingesting a form
+    first removes its old contribution (wherever its date put it) and then adds
+    the new one. Unchanged forms are skipped. Returns the number of forms that
+    were added or updated.
+    """
+    if stage not in STAGES:
+        raise ValueError(f"Unknown stage: {stage}")
+    return _fold_records(stage, _form_records(stage, df), root)
+
+
+def index_chunks(stage, chunks, root=TREND_INDEX_DIR):
+    """
+    Passes export chunks through unchanged and indexes them once they are done.
+
+    Each chunk is reduced to its small per-form contributions on the way
+    through; the registry and partitions are loaded and saved only once, after
+    the last chunk, instead of once per chunk.
+    """
+    if stage not in STAGES:
+        raise ValueError(f"Unknown stage: {stage}")
+    records = []
+    for chunk in chunks:
+        records.append(_form_records(stage, chunk))
+        yield chunk
+    if records:
+        _fold_records(stage, pd.concat(records, ignore_index=True), root)
+
+
+def query_trend(stage, freq="M", start=None, end=None, root=TREND_INDEX_DIR):
+    """
+    Rolls the indexed daily buckets up into weekly ("W") or monthly ("M") trends.
+
+    Only the month partitions overlapping [start, end] are read. Returns one row
+    per period with volume, complication_rate, avg_los and avg_vas.
+    """
+    start_month = pd.Timestamp(start).strftime("%Y-%m") if start is not None else None
+    end_month = pd.Timestamp(end).strftime("%Y-%m") if end is not None else None
+
+    rows = []
+    for path in sorted((Path(root) / stage).glob("*.json")):
+        month = path.stem
+        if (start_month and month < start_month) or (end_month and month > end_month):
+            continue
+        for day, bucket in _load_partition(path)["days"].items():
+            rows.append({"day": day, **bucket})
+
+    columns = ["volume", "complication_rate", "avg_los", "avg_vas"]
+    if not rows:
+        return pd.DataFrame(columns=columns, index=pd.DatetimeIndex([], name="period"))
+
+    days = pd.DataFrame(rows)
+    days["day"] = pd.to_datetime(days["day"])
+    if start is not None:
+        days = days[days["day"] >= pd.Timestamp(start)]
+    if end is not None:
+        days = days[days["day"] <= pd.Timestamp(end)]
+
+    rule = "W-MON" if freq == "W" else "MS"
+    label = "left" if freq == "W" else None
+    closed = "left" if freq == "W" else None
+    totals = days.set_index("day")[BUCKET_FIELDS].resample(rule, label=label, closed=closed).sum()
+    totals = totals[totals["volume"] > 0]
+
+    trend = pd.DataFrame(index=totals.index)
+    trend["volume"] = totals["volume"].astype(int)
+    trend["complication_rate"] = totals["complications"] / totals["volume"]
+    trend["avg_los"] = totals["los_sum"] / totals["los_n"].where(totals["los_n"] > 0)
+    trend["avg_vas"] = totals["vas_sum"] / totals["vas_n"].where(totals["vas_n"] > 0)
+    trend.index.name = "period"
+    return trend